@@ -1,7 +1,8 @@
 import sys
 import time
-import threading
 import os
+import threading
+import functools
 from pathlib import Path
 
 from PyQt6.QtWidgets import (
@@ -9,14 +10,18 @@ from PyQt6.QtWidgets import (
     QHBoxLayout, QVBoxLayout, QPushButton,
     QSlider, QLabel, QFileDialog, QToolBar
 )
-from PyQt6.QtCore import Qt, QTimer, QSize
-from PyQt6.QtGui import QPixmap, QIcon, QKeySequence, QAction
+from PyQt6.QtCore import (
+    Qt, QTimer, QSize, QObject, QRunnable, QThreadPool,
+    QProcess, QSignalBlocker, QBuffer, QIODevice, pyqtSignal
+)
+from PyQt6.QtGui import QPixmap, QImage, QIcon, QKeySequence, QAction
 
 from play_audio import (
+    AUDIO_EXTS,
     play,
-    get_audio_duration_ffmpeg,
-    extract_cover_art,
-    get_metadata
+    get_track_info,
+    is_cache_file,
+    write_cache_file
 )
 
 HERE = os.path.dirname(os.path.abspath(__file__))
@@ -25,54 +30,95 @@ DEFAULT_COVER = os.path.join(HERE, "default.png")
 PLAY_IMG = os.path.join(HERE, "play.png")
 PAUSE_IMG = os.path.join(HERE, "pause.png")
 
+AUDIO_FILTER = "Audio Files ({})".format(" ".join(f"*{ext}" for ext in sorted(AUDIO_EXTS)))
+PREFETCH_LIMIT = 8
+
 def format_time(seconds: float) -> str:
-    seconds = max(0, int(seconds or 0))
-    h = seconds // 3600
-    m = (seconds % 3600) // 60
-    s = seconds % 60
-    return f"{h:02}:{m:02}:{s:02}"
-
-class PlayerThread(threading.Thread):
-    def __init__(self, file_path: str, start_ts: float = 0.0):
-        super().__init__(daemon=True)
+    return _format_whole_seconds(max(0, int(seconds or 0)))
+
+@functools.lru_cache(maxsize=4096)
+def _format_whole_seconds(seconds: int) -> str:
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return f"{h:02d}:{m:02d}:{s:02d}"
+
+# Built lazily since QPixmap needs a running QApplication
+_default_pix = None
+
+def _default_cover_pixmap() -> QPixmap:
+    global _default_pix
+    if _default_pix is None:
+        _default_pix = QPixmap(DEFAULT_COVER).scaled(256, 256, Qt.AspectRatioMode.KeepAspectRatio,
+                                                     Qt.TransformationMode.SmoothTransformation)
+    return _default_pix
+
+class ProbeSignals(QObject):
+    finished = pyqtSignal(dict)
+
+
+class ProbeWorker(QRunnable):
+    def __init__(self, file_path: str):
+        super().__init__()
         self.file_path = file_path
-        self.start_ts = float(start_ts or 0.0)
-        self.proc = None
-        self._stop_requested = threading.Event()
+        self.signals = ProbeSignals()
 
     def run(self):
+        # Always report back, otherwise the window stays on "Loading…"
         try:
-            result = play(self.file_path, self.start_ts)
-            self.proc = result[0] if isinstance(result, (tuple, list)) else result
-
-            while self.proc is not None and self.proc.poll() is None and not self._stop_requested.is_set():
-                time.sleep(0.1)
-
-            if self._stop_requested.is_set() and self.proc is not None and self.proc.poll() is None:
-                try:
-                    self.proc.terminate()
-                    time.sleep(0.1)
-                    if self.proc.poll() is None:
-                        self.proc.kill()
-                except Exception:
-                    pass
+            duration, metadata, cover_path = get_track_info(self.file_path)
+
+            cover_image = None
+            if cover_path:
+                img = QImage(cover_path)
+                if not img.isNull():
+                    oversized = img.width() > 256 or img.height() > 256
+                    img = img.scaled(256, 256, Qt.AspectRatioMode.KeepAspectRatio,
+                                     Qt.TransformationMode.SmoothTransformation)
+                    # Shrink our own cached copy so later opens decode a small file
+                    if oversized and is_cache_file(cover_path):
+                        buf = QBuffer()
+                        buf.open(QIODevice.OpenModeFlag.WriteOnly)
+                        fmt = "PNG" if cover_path.lower().endswith(".png") else "JPG"
+                        if img.save(buf, fmt, 90):
+                            write_cache_file(cover_path, bytes(buf.data()))
+                    cover_image = img
         except Exception:
-            print("Uh Oh!")
+            duration, metadata, cover_path, cover_image = 0.0, {}, None, None
+
+        self.signals.finished.emit({
+            "path": self.file_path,
+            "duration": duration,
+            "metadata": metadata,
+            "cover_path": cover_path,
+            "cover_image": cover_image,
+        })
+
+
+class PrefetchWorker(QRunnable):
+    def __init__(self, file_path: str, pool: QThreadPool, cancelled: threading.Event):
+        super().__init__()
+        self.file_path = file_path
+        self.pool = pool
+        self.cancelled = cancelled
+
+    def run(self):
+        # Listing a slow or network folder must not block the GUI thread
+        chosen = Path(self.file_path)
+        try:
+            siblings = sorted(p for p in chosen.parent.iterdir()
+                              if p.suffix.lower() in AUDIO_EXTS and p.is_file())
+        except OSError:
+            return
+
+        # Tracks after the chosen one are the likeliest to be opened next
+        idx = siblings.index(chosen) if chosen in siblings else -1
+        upcoming = siblings[idx + 1:] + siblings[:max(idx, 0)]
+
+        for p in upcoming[:PREFETCH_LIMIT]:
+            if self.cancelled.is_set():
+                return
+            self.pool.start(ProbeWorker(str(p)), -1)
 
-    def stop(self, timeout: float = 1.0):
-        self._stop_requested.set()
-        if self.proc is not None and getattr(self.proc, "poll", lambda: 1)() is None:
-            try:
-                self.proc.terminate()
-            except Exception:
-                pass
-        self.join(timeout=timeout)
-        if self.is_alive():
-            try:
-                if self.proc is not None and getattr(self.proc, "poll", lambda: 1)() is None:
-                    self.proc.kill()
-            except Exception:
-                pass
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -82,14 +128,18 @@ class MainWindow(QMainWindow):
 
         # Playback state
         self.file_path = DEFAULT_FILE
-        self.player_thread = None
+        self.proc = None
         self.ts_start = 0.0 
         self.last_play_clock = None
         self.status = "Paused"
 
-        self.duration = get_audio_duration_ffmpeg(self.file_path)
-        self.metadata = get_metadata(self.file_path)
-        self.cover_path = extract_cover_art(self.file_path) or DEFAULT_COVER
+        # Filled in by _on_probe_finished once the background probe returns
+        self.duration = 0.0
+        self.metadata = {}
+        self.cover_path = DEFAULT_COVER
+
+        self._play_icon = QIcon(PLAY_IMG)
+        self._pause_icon = QIcon(PAUSE_IMG)
 
         self._build_ui()
         self._create_toolbar()
@@ -100,6 +150,17 @@ class MainWindow(QMainWindow):
         self.timer.timeout.connect(self._update_ui)
 
         self._is_seeking = False
+        self._press_sec = -1
+        self._slider_dragged = False
+        self._last_sec = -1
+        self._last_px = -1
+
+        # Background cache warm-up for the other tracks in an opened folder
+        self._prefetch_pool = QThreadPool(self)
+        self._prefetch_pool.setMaxThreadCount(2)
+        self._prefetch_cancel = threading.Event()
+
+        self._start_probe()
 
     # ----------------     UI      ----------------
 
@@ -107,9 +168,7 @@ class MainWindow(QMainWindow):
         root = QVBoxLayout()
 
         # Title
-        title_text = self.metadata.get("title") or Path(self.file_path).stem
-        artist_text = self.metadata.get("artist") or ""
-        self.header = QLabel(f"{title_text} — {artist_text}", alignment=Qt.AlignmentFlag.AlignCenter)
+        self.header = QLabel("Loading…", alignment=Qt.AlignmentFlag.AlignCenter)
         self.header.setFixedHeight(28)
         root.addWidget(self.header)
 
@@ -134,6 +193,7 @@ class MainWindow(QMainWindow):
         self.slider.setSingleStep(1)
         self.slider.sliderPressed.connect(self._on_slider_pressed)
         self.slider.sliderReleased.connect(self._on_slider_released)
+        self.slider.sliderMoved.connect(self._on_slider_moved)
         row.addWidget(self.slider)
 
         self.total_label = QLabel(format_time(self.duration))
@@ -143,7 +203,7 @@ class MainWindow(QMainWindow):
         root.addLayout(row)
 
         self.play_button = QPushButton()
-        self.play_button.setIcon(QIcon(PLAY_IMG))
+        self.play_button.setIcon(self._play_icon)
         self.play_button.setIconSize(QSize(48, 48))
         self.play_button.clicked.connect(self.toggle_play_pause)
         root.addWidget(self.play_button, alignment=Qt.AlignmentFlag.AlignCenter)
@@ -152,13 +212,18 @@ class MainWindow(QMainWindow):
         container.setLayout(root)
         self.setCentralWidget(container)
 
-    def _update_cover_pixmap(self):
-        if self.cover_path and os.path.exists(self.cover_path):
-            pix = QPixmap(self.cover_path).scaled(256, 256, Qt.AspectRatioMode.KeepAspectRatio,
-                                                  Qt.TransformationMode.SmoothTransformation)
-        else:
-            pix = QPixmap(DEFAULT_COVER).scaled(256, 256, Qt.AspectRatioMode.KeepAspectRatio,
-                                               Qt.TransformationMode.SmoothTransformation)
+    def _update_cover_pixmap(self, image: QImage = None):
+        pix = None
+        if image is not None:
+            pix = QPixmap.fromImage(image)
+        elif self.cover_path and self.cover_path != DEFAULT_COVER:
+            # A missing or unreadable file just yields a null pixmap
+            pix = QPixmap(self.cover_path)
+            if not pix.isNull():
+                pix = pix.scaled(256, 256, Qt.AspectRatioMode.KeepAspectRatio,
+                                 Qt.TransformationMode.SmoothTransformation)
+        if pix is None or pix.isNull():
+            pix = _default_cover_pixmap()
         self.cover_label.setPixmap(pix)
 
     # ----------------       Toolbar       ----------------
@@ -189,27 +254,33 @@ class MainWindow(QMainWindow):
 
     def open_file_dialog(self):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open Audio File", "",
-                                                   "Audio Files (*.mp3 *.wav *.flac *.m4a *.aac)")
+                                                   AUDIO_FILTER)
         if file_path:
             self.load_new_track(file_path)
+            self._prefetch_directory(file_path)
+
+    def _prefetch_directory(self, file_path: str):
+        self._cancel_prefetch()
+        self._prefetch_pool.start(
+            PrefetchWorker(file_path, self._prefetch_pool, self._prefetch_cancel), -1)
+
+    def _cancel_prefetch(self):
+        self._prefetch_cancel.set()
+        self._prefetch_pool.clear()
+        self._prefetch_cancel = threading.Event()
 
     def load_new_track(self, new_path: str):
-        if self.player_thread:
-            self.player_thread.stop()
-            self.player_thread = None
+        self._stop_player()
 
         self.file_path = new_path
-        self.duration = get_audio_duration_ffmpeg(self.file_path)
-        self.metadata = get_metadata(self.file_path)
-        self.cover_path = extract_cover_art(self.file_path) or DEFAULT_COVER
-
-        title_text = self.metadata.get("title") or Path(self.file_path).stem
-        artist_text = self.metadata.get("artist") or ""
-        self.header.setText(f"{title_text} — {artist_text}")
+        self.duration = 0.0
+        self.metadata = {}
+        self.cover_path = DEFAULT_COVER
 
+        self.header.setText("Loading…")
         self._update_cover_pixmap()
 
-        self.slider.setRange(0, max(0, int(self.duration)))
+        self.slider.setRange(0, 0)
         self.slider.setValue(0)
         self.elapsed_label.setText("00:00:00")
         self.total_label.setText(format_time(self.duration))
@@ -217,9 +288,35 @@ class MainWindow(QMainWindow):
         self.ts_start = 0.0
         self.last_play_clock = None
         self.status = "Paused"
-        self.play_button.setIcon(QIcon(PLAY_IMG))
+        self.play_button.setIcon(self._play_icon)
         self.timer.stop()
 
+        self._start_probe()
+
+    def _start_probe(self):
+        worker = ProbeWorker(self.file_path)
+        worker.signals.finished.connect(self._on_probe_finished)
+        QThreadPool.globalInstance().start(worker)
+
+    def _on_probe_finished(self, info: dict):
+        # A newer track may have been opened while this probe was running
+        if info["path"] != self.file_path:
+            return
+
+        self.duration = info["duration"]
+        self.metadata = info["metadata"]
+        self.cover_path = info["cover_path"] or DEFAULT_COVER
+
+        title_text = self.metadata.get("title") or Path(self.file_path).stem
+        artist_text = self.metadata.get("artist") or ""
+        self.header.setText(f"{title_text} — {artist_text}")
+
+        self._update_cover_pixmap(info["cover_image"])
+
+        self.slider.setRange(0, max(0, int(self.duration)))
+        self.total_label.setText(format_time(self.duration))
+        self._last_px = -1
+
     # ---------------- Play / Pause / Seek logic ----------------
 
     def toggle_play_pause(self):
@@ -231,61 +328,105 @@ class MainWindow(QMainWindow):
             self.pause_play()
 
     def start_play(self):
-        if self.player_thread and self.player_thread.proc and self.player_thread.proc.poll() is None:
+        if self.proc is not None and self.proc.state() != QProcess.ProcessState.NotRunning:
             return
 
         if self.last_play_clock is None:
             if self.slider.value() > 0:
                 self.ts_start = float(self.slider.value())
 
-        self.player_thread = PlayerThread(self.file_path, self.ts_start)
-        self.player_thread.start()
+        self.proc = play(self.file_path, self.ts_start, self)
+        self.proc.finished.connect(self._on_playback_finished)
+        self.proc.errorOccurred.connect(self._on_playback_error)
         self.last_play_clock = time.time()
+        self._last_sec = -1
+        self._last_px = -1
         self.timer.start()
         self.status = "Playing"
-        self.play_button.setIcon(QIcon(PAUSE_IMG))
+        self.play_button.setIcon(self._pause_icon)
+        # Last, so a start failure reported from inside start() finds the
+        # playing state fully set up and pause_play can undo all of it
+        self.proc.start()
 
     def pause_play(self):
         if self.last_play_clock is not None:
             elapsed = (time.time() - self.last_play_clock) + self.ts_start
+            if self.duration > 0:
+                elapsed = min(elapsed, self.duration)
             self.ts_start = max(0.0, float(elapsed))
 
-        if self.player_thread:
-            self.player_thread.stop()
-            self.player_thread = None
+        self._stop_player()
 
         self.last_play_clock = None
         self.timer.stop()
         self.status = "Paused"
-        self.play_button.setIcon(QIcon(PLAY_IMG))
+        self.play_button.setIcon(self._play_icon)
         self.elapsed_label.setText(format_time(self.ts_start))
-        try:
-            self.slider.blockSignals(True)
+        with QSignalBlocker(self.slider):
             self.slider.setValue(int(self.ts_start))
-        finally:
-            self.slider.blockSignals(False)
+
+    def _stop_player(self):
+        if self.proc is None:
+            return
+        proc, self.proc = self.proc, None
+        # Our own terminate() must not be reported as the track ending
+        proc.finished.disconnect()
+        proc.errorOccurred.disconnect()
+        if proc.state() != QProcess.ProcessState.NotRunning:
+            proc.terminate()
+            if not proc.waitForFinished(1000):
+                proc.kill()
+                proc.waitForFinished(1000)
+        # We may be inside this process's own finished signal, so let Qt
+        # delete it once control returns to the event loop
+        proc.deleteLater()
+
+    def _on_playback_finished(self, exit_code: int, exit_status: QProcess.ExitStatus):
+        self.pause_play()
+
+    def _on_playback_error(self, error: QProcess.ProcessError):
+        if error == QProcess.ProcessError.FailedToStart:
+            print("Uh Oh!")
+            self.pause_play()
 
     # ----------------     Slider      ----------------
 
     def _on_slider_pressed(self):
+        # Keep ffplay running while the handle is dragged; it is only
+        # restarted on release if the position actually changed.
         self._is_seeking = True
+        self._slider_dragged = False
         self.timer.stop()
+        # Don't touch the value here: a click-to-position has already moved it
+        self._press_sec = -1
         if self.last_play_clock is not None:
-            elapsed = (time.time() - self.last_play_clock) + self.ts_start
-            self.ts_start = max(0.0, float(elapsed))
-        if self.player_thread:
-            self.player_thread.stop()
-            self.player_thread = None
-        self.last_play_clock = None
-        self.status = "Paused"
-        self.play_button.setIcon(QIcon(PLAY_IMG))
+            self._press_sec = int((time.time() - self.last_play_clock) + self.ts_start)
+
+    def _on_slider_moved(self, value: int):
+        self._slider_dragged = True
 
     def _on_slider_released(self):
         new_ts = float(self.slider.value())
-        self.ts_start = new_ts
         self._is_seeking = False
+        self._last_sec = -1
+        self._last_px = -1
+
+        # ffplay kept playing while the handle was held. If it was not dragged
+        # and still sits where playback was at press time (the handle only moves
+        # per pixel, so compare at pixel resolution), there is nothing to seek.
+        if (self.last_play_clock is not None and not self._slider_dragged
+                and self._slider_px(new_ts) == self._slider_px(self._press_sec)):
+            self.timer.start()
+            return
+
+        self._stop_player()
+        self.last_play_clock = None
+        self.ts_start = new_ts
         self.start_play()
 
+    def _slider_px(self, seconds: float) -> int:
+        return int(seconds * self.slider.width() / max(1, self.duration))
+
     # ----------------      UI update       ----------------
 
     def _update_ui(self):
@@ -294,15 +435,27 @@ class MainWindow(QMainWindow):
         if self.last_play_clock is None:
             return
         elapsed = (time.time() - self.last_play_clock) + self.ts_start
-        if self.duration > 0 and elapsed >= self.duration:
-            elapsed = self.duration
-            self.pause_play()
+        # End of track is reported by ffplay's finished signal; the timer only
+        # drives the clock, so just hold at the end until that arrives
+        if self.duration > 0:
+            elapsed = min(elapsed, self.duration)
+
+        # Only touch the widgets when the displayed second changes
+        sec = int(elapsed)
+        if sec == self._last_sec:
+            return
+        self._last_sec = sec
+
         self.elapsed_label.setText(format_time(elapsed))
-        try:
-            self.slider.blockSignals(True)
+
+        # On long tracks many seconds map to the same handle position
+        px = self._slider_px(elapsed)
+        if px == self._last_px:
+            return
+        self._last_px = px
+
+        with QSignalBlocker(self.slider):
             self.slider.setValue(int(elapsed))
-        finally:
-            self.slider.blockSignals(False)
 
     # ---------------- Window geometry & cleanup ----------------
 
@@ -311,9 +464,8 @@ class MainWindow(QMainWindow):
         self.setGeometry((screen.width() - w) // 2, (screen.height() - h) // 2, w, h)
 
     def closeEvent(self, event):
-        if self.player_thread:
-            self.player_thread.stop()
-            self.player_thread = None
+        self._stop_player()
+        self._cancel_prefetch()
         event.accept()
 
 
@@ -1,91 +1,338 @@
 import ffmpeg
 import subprocess
 import os
+import base64
 import tempfile
+import json
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
 
+from PyQt6.QtCore import QObject, QProcess
+from mutagen import File as MutagenFile
+from mutagen.id3 import ID3
+from mutagen.flac import FLAC, Picture
+from mutagen.mp4 import MP4
 
-def get_audio_duration_ffmpeg(file_path: str) -> float:
+_TMPDIR = tempfile.gettempdir()
+# Per-user and private, so cached cover paths can be trusted when read back
+_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "musicplayer"
+_CACHE_DB = _CACHE_DIR / "probe_cache.sqlite3"
+CACHE_MAX_ENTRIES = 5000
+_db_local = threading.local()
+_cache_lock = threading.Lock()
+_cache_pruned = False
+
+AUDIO_EXTS = frozenset({'.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.opus'})
+COVER_EXTS = AUDIO_EXTS | {'.mp4'}
+# Containers whose embedded art is read in-process; ffmpeg is never run for these
+INPROC_COVER_EXTS = frozenset({'.mp3', '.flac', '.m4a', '.mp4', '.ogg', '.opus'})
+# Containers where mutagen's easy/Vorbis-comment keys give usable tag names.
+# WAV only has raw ID3 frame ids there and no RIFF INFO, so it goes to ffprobe.
+EASY_TAG_EXTS = frozenset({'.mp3', '.flac', '.m4a', '.mp4', '.ogg', '.opus'})
+
+
+def _probe(file_path: str) -> dict | None:
     try:
-        probe = ffmpeg.probe(file_path)
-        if 'format' in probe and 'duration' in probe['format']:
-            return float(probe['format']['duration'])
-        audio_stream = next((s for s in probe.get('streams', []) if s.get('codec_type') == 'audio'), None)
-        if audio_stream and 'duration' in audio_stream:
-            return float(audio_stream['duration'])
-    except ffmpeg.Error:
-        pass
+        # analyzeduration is in microseconds; 0 would fall back to the 5 s default
+        return ffmpeg.probe(file_path, probesize="100k", analyzeduration=100000)
     except Exception:
+        return None
+
+
+def _cover_stream(probe: dict) -> dict | None:
+    return next(
+        (s for s in probe.get('streams', [])
+         if s.get('codec_type') == 'video' or s.get('disposition', {}).get('attached_pic') == 1),
+        None
+    )
+
+
+def _parse_probe(probe: dict | None) -> tuple[float, dict, bool]:
+    if not probe:
+        return 0.0, {}, False
+
+    streams = probe.get('streams', [])
+    fmt = probe.get('format', {})
+
+    duration = 0.0
+    try:
+        if 'duration' in fmt:
+            duration = float(fmt['duration'])
+        else:
+            audio_stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+            if audio_stream and 'duration' in audio_stream:
+                duration = float(audio_stream['duration'])
+    except (TypeError, ValueError):
         pass
-    return 0.0
+
+    # Vorbis comments come back upper-case (TITLE); match mutagen's keys
+    tags = {key.lower(): value for key, value in (fmt.get('tags', {}) or {}).items()}
+    return duration, tags, _cover_stream(probe) is not None
 
 
-def get_metadata(file_path: str) -> dict:
+def probe_fast(file_path: str) -> tuple[float, dict] | None:
     try:
-        probe = ffmpeg.probe(file_path)
-        return probe.get('format', {}).get('tags', {}) or {}
+        mf = MutagenFile(file_path, easy=True)
     except Exception:
-        return {}
+        return None
+    if mf is None or not getattr(mf.info, "length", 0):
+        return None
+
+    tags = {}
+    for key in (mf.tags.keys() if mf.tags else []):
+        # Embedded cover art (base64, possibly megabytes), not a text tag
+        if key.lower() == 'metadata_block_picture':
+            continue
+        value = mf.tags[key]
+        tags[key.lower()] = ", ".join(map(str, value)) if isinstance(value, list) else str(value)
+    return float(mf.info.length), tags
+
+
+def _is_nonempty_file(path: str) -> bool:
+    try:
+        return os.stat(path).st_size > 0
+    except OSError:
+        return False
+
+
+def _cover_out_path(file_path: str, out_dir: str, ext: str) -> str:
+    base_name = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()
+    return os.path.join(out_dir, f"{base_name}_cover.{ext}")
+
+
+def extract_cover_inproc(file_path: str) -> bytes | None:
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext == '.mp3':
+            apics = ID3(file_path).getall('APIC')
+            return apics[0].data if apics else None
+        if ext == '.flac':
+            pictures = FLAC(file_path).pictures
+            return pictures[0].data if pictures else None
+        if ext in ('.m4a', '.mp4'):
+            tags = MP4(file_path).tags
+            covers = tags.get('covr') if tags else None
+            return bytes(covers[0]) if covers else None
+        if ext in ('.ogg', '.opus'):
+            mf = MutagenFile(file_path)
+            pictures = mf.tags.get('metadata_block_picture') if mf is not None and mf.tags else None
+            return Picture(base64.b64decode(pictures[0])).data if pictures else None
+    except Exception:
+        pass
+    return None
+
+
+# Other workers may be reading the same cover, so never truncate it in place:
+# write a private temp file next to it and rename it over the old one.
+def write_cache_file(out_path: str, data: bytes) -> bool:
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(out_path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, out_path)
+    except OSError:
+        _remove_quietly(tmp)
+        return False
+    return True
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
 
 
-def extract_cover_art(file_path: str, out_dir: str = None) -> str | None:
+def _save_cover_inproc(file_path: str, out_dir: str) -> str | None:
+    data = extract_cover_inproc(file_path)
+    if not data:
+        return None
+
+    ext = "png" if data.startswith(b"\x89PNG") else "jpg"
+    out_path = _cover_out_path(file_path, out_dir, ext)
+    return out_path if write_cache_file(out_path, data) else None
+
+
+def extract_cover_art(file_path: str, out_dir: str = None, probe: dict = None) -> str | None:
+    if os.path.splitext(file_path)[1].lower() not in COVER_EXTS:
+        return None
+
+    if probe is None:
+        probe = _probe(file_path)
+        if probe is None:
+            return None
+    stream = _cover_stream(probe)
+    if stream is None:
+        return None
+
     if out_dir is None:
-        out_dir = tempfile.gettempdir()
+        out_dir = _TMPDIR
+
+    ext = "png" if stream.get('codec_name') == 'png' else "jpg"
+    out_path = _cover_out_path(file_path, out_dir, ext)
 
-    base_name = os.path.splitext(os.path.basename(file_path))[0]
-    jpg_out = os.path.join(out_dir, f"{base_name}_cover.jpg")
-    png_out = os.path.join(out_dir, f"{base_name}_cover.png")
+    # Same rule as write_cache_file: ffmpeg writes a temp file that is then
+    # renamed into place; the suffix lets ffmpeg pick the image muxer
+    try:
+        fd, tmp = tempfile.mkstemp(dir=out_dir, prefix=".tmp-", suffix=f".{ext}")
+        os.close(fd)
+    except OSError:
+        return None
 
     cmd = [
         "ffmpeg", "-y", "-v", "error", "-i", file_path,
-        "-map", "0:v:0",
+        "-map", f"0:{stream.get('index', 'v:0')}",
         "-c", "copy",
-        jpg_out
+        tmp
     ]
     try:
         rc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if rc.returncode == 0 and os.path.exists(jpg_out) and os.path.getsize(jpg_out) > 0:
-            return jpg_out
+        if rc.returncode == 0 and _is_nonempty_file(tmp):
+            os.replace(tmp, out_path)
+            return out_path
     except Exception:
         pass
 
+    _remove_quietly(tmp)
+    return None
+
+
+def _ensure_cache_dir() -> Path:
+    _CACHE_DIR.mkdir(mode=0o700, parents=True, exist_ok=True)
+    return _CACHE_DIR
+
+
+def is_cache_file(path: str) -> bool:
+    return os.path.dirname(os.path.realpath(path)) == os.path.realpath(_CACHE_DIR)
+
+
+# One connection per thread; sqlite serialises the writers itself
+def _db() -> sqlite3.Connection:
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        _ensure_cache_dir()
+        conn = sqlite3.connect(_CACHE_DB, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, "
+            "duration REAL, tags TEXT, cover TEXT, stored_at REAL)"
+        )
+        _db_local.conn = conn
+        _prune_cache(conn)
+    return conn
+
+
+def _prune_cache(conn: sqlite3.Connection):
+    global _cache_pruned
+    with _cache_lock:
+        if _cache_pruned:
+            return
+        _cache_pruned = True
+
+    stale = conn.execute(
+        "SELECT path, cover FROM tracks ORDER BY stored_at DESC LIMIT -1 OFFSET ?",
+        (CACHE_MAX_ENTRIES,)
+    ).fetchall()
+    if not stale:
+        return
+    with conn:
+        conn.executemany("DELETE FROM tracks WHERE path = ?", [(path,) for path, _ in stale])
+    for _, cover in stale:
+        if cover and is_cache_file(cover):
+            try:
+                os.remove(cover)
+            except OSError:
+                pass
+
+
+def _cache_get(path: str) -> tuple | None:
     try:
-        cmd2 = [
-            "ffmpeg", "-y", "-v", "error", "-i", file_path,
-            "-an", "-vcodec", "copy", jpg_out
-        ]
-        rc = subprocess.run(cmd2, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if rc.returncode == 0 and os.path.exists(jpg_out) and os.path.getsize(jpg_out) > 0:
-            return jpg_out
-    except Exception:
-        pass
+        return _db().execute(
+            "SELECT mtime_ns, size, duration, tags, cover FROM tracks WHERE path = ?", (path,)
+        ).fetchone()
+    except (sqlite3.Error, OSError):
+        return None
+
 
+def _cache_put(path: str, st: os.stat_result, duration: float, tags: dict, cover: str | None):
     try:
-        cmd3 = [
-            "ffmpeg", "-y", "-v", "error", "-i", file_path,
-            "-map", "0:v:0",
-            "-c", "copy",
-            png_out
-        ]
-        rc = subprocess.run(cmd3, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        if rc.returncode == 0 and os.path.exists(png_out) and os.path.getsize(png_out) > 0:
-            return png_out
-    except Exception:
+        conn = _db()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (path, st.st_mtime_ns, st.st_size, duration, json.dumps(tags), cover, time.time())
+            )
+    except (sqlite3.Error, OSError, TypeError, ValueError):
         pass
 
-    return None
 
+# Cached by path; an entry is only reused while the file's mtime and size match.
+def get_track_info(file_path: str) -> tuple[float, dict, str | None]:
+    path = os.path.abspath(file_path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return 0.0, {}, None
+
+    row = _cache_get(path)
+    if row and row[0] == st.st_mtime_ns and row[1] == st.st_size:
+        duration, tags_json, cover = row[2], row[3], row[4]
+        if cover is None or (is_cache_file(cover) and _is_nonempty_file(cover)):
+            try:
+                return duration or 0.0, json.loads(tags_json or "{}"), cover
+            except ValueError:
+                pass
+
+    # mutagen reads duration and tags from the container header without a
+    # subprocess; ffprobe handles the other containers and anything it can't parse
+    ext = os.path.splitext(path)[1].lower()
+    fast = probe_fast(path) if ext in EASY_TAG_EXTS else None
+    if fast is not None:
+        duration, tags = fast
+        # Art is only looked for in-process here, never via ffprobe
+        probe = None
+        has_cover = ext in INPROC_COVER_EXTS
+    else:
+        probe = _probe(path)
+        duration, tags, has_cover = _parse_probe(probe)
+
+    cover = None
+    if has_cover:
+        try:
+            cache_dir = str(_ensure_cache_dir())
+        except OSError:
+            cache_dir = None
+        if cache_dir and ext in INPROC_COVER_EXTS:
+            cover = _save_cover_inproc(path, cache_dir)
+        elif cache_dir:
+            cover = extract_cover_art(path, cache_dir, probe=probe)
 
-def _start_ffplay_at(file_path: str, start_seconds: float) -> subprocess.Popen:
+    _cache_put(path, st, duration, tags, cover)
+    return duration, tags, cover
+
+
+def _ffplay_process(file_path: str, start_seconds: float, parent: QObject = None) -> QProcess:
     ss_args = []
     if start_seconds and start_seconds > 0:
         ss_args = ["-ss", str(float(start_seconds))]
 
-    cmd = ["ffplay", "-nodisp", "-autoexit", "-hide_banner", "-loglevel", "error"] + ss_args + [file_path]
-    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # Cap stream probing at 100 kB / 0.1 s (analyzeduration is in microseconds;
+    # 0 would mean "use the 5 s default") so each seek restart opens faster
+    probe_args = ["-probesize", "100k", "-analyzeduration", "100000"]
+    args = (["-nodisp", "-autoexit", "-hide_banner", "-loglevel", "error"]
+            + probe_args + ss_args + [file_path])
+    proc = QProcess(parent)
+    proc.setProgram("ffplay")
+    proc.setArguments(args)
+    proc.setStandardOutputFile(QProcess.nullDevice())
+    proc.setStandardErrorFile(QProcess.nullDevice())
     return proc
 
 
-def play(audio_file: str, ts: float):
-    proc = _start_ffplay_at(audio_file, ts)
-    return (proc,)
-
+# Returned unstarted so the caller can connect finished/errorOccurred before start()
+def play(audio_file: str, ts: float, parent: QObject = None) -> QProcess:
+    return _ffplay_process(audio_file, ts, parent)